@@ -21,8 +21,18 @@ namespace PupilTrack
         private const string SavedFolderPath = @"C:\Users\dswsm\source\repos\smith8dk\PupilTrackMAUI\PupilTrack\Resources\python\saved\";
         private double videoDuration = 1.0;
 
+        // Set when the page is opened for a just-finished job; otherwise the latest saved results are loaded.
+        private readonly string videoPath;
+        private readonly double[] movementTimestamps;
+
         public HGNResultsPage() : this(NullLogger<HGNResultsPage>.Instance) { }
 
+        public HGNResultsPage(string videoPath, double[] movementTimestamps) : this()
+        {
+            this.videoPath = videoPath;
+            this.movementTimestamps = movementTimestamps;
+        }
+
         public HGNResultsPage(ILogger<HGNResultsPage> logger)
         {
             InitializeComponent();
@@ -31,12 +41,20 @@ namespace PupilTrack
             PositionSlider.SizeChanged += PositionSlider_SizeChanged;
         }
 
-        protected override async void OnAppearing()
+        protected override void OnAppearing()
         {
             base.OnAppearing();
-            await Task.Delay(5000);
-            LoadLatestVideo();
-            LoadMovementData();
+            if (videoPath != null)
+            {
+                VideoPlayer.Source = MediaSource.FromFile(videoPath);
+                logger.LogInformation("Loaded processed video: {File}", videoPath);
+                ShowMovementData(movementTimestamps ?? Array.Empty<double>());
+            }
+            else
+            {
+                LoadLatestVideo();
+                LoadMovementData();
+            }
         }
 
         private void LoadLatestVideo()
@@ -78,21 +96,14 @@ namespace PupilTrack
                         using JsonDocument doc = JsonDocument.Parse(jsonContent);
                         if (doc.RootElement.TryGetProperty("sudden_movements", out JsonElement movementArray))
                         {
-                            int count = movementArray.GetArrayLength();
-                            MovementCounterLabel.Text = $"Sudden Movements: {count}";
-
-                            string timestampsText = "Timestamps:\n";
-                            double[] timestamps = new double[count];
+                            double[] timestamps = new double[movementArray.GetArrayLength()];
                             int index = 0;
                             foreach (JsonElement element in movementArray.EnumerateArray())
                             {
-                                double t = element.GetDouble();
-                                timestampsText += $"{t:F2} s\n";
-                                timestamps[index++] = t;
+                                timestamps[index++] = element.GetDouble();
                             }
-                            MovementTimestampsLabel.Text = timestampsText;
-                            logger.LogInformation("Loaded movement data from {JsonFile}: {Count} movements", latestJson, count);
-                            UpdateSliderMarkers(timestamps);
+                            ShowMovementData(timestamps);
+                            logger.LogInformation("Loaded movement data from {JsonFile}: {Count} movements", latestJson, timestamps.Length);
                         }
                         else
                         {
@@ -123,6 +134,25 @@ namespace PupilTrack
             }
         }
 
+        private void ShowMovementData(double[] timestamps)
+        {
+            MovementCounterLabel.Text = $"Sudden Movements: {timestamps.Length}";
+            if (timestamps.Length == 0)
+            {
+                MovementTimestampsLabel.Text = "Timestamps: None";
+            }
+            else
+            {
+                string timestampsText = "Timestamps:\n";
+                foreach (double t in timestamps)
+                {
+                    timestampsText += $"{t:F2} s\n";
+                }
+                MovementTimestampsLabel.Text = timestampsText;
+            }
+            UpdateSliderMarkers(timestamps);
+        }
+
         private void UpdateSliderMarkers(double[] timestamps)
         {
             MarkerContainer.Children.Clear();
@@ -154,8 +184,11 @@ namespace PupilTrack
 
         private void PositionSlider_SizeChanged(object sender, EventArgs e)
         {
-            // Reload movement data to update markers.
-            LoadMovementData();
+            // Redraw the markers for the new slider width.
+            if (movementTimestamps != null)
+                UpdateSliderMarkers(movementTimestamps);
+            else
+                LoadMovementData();
         }
 
         void VideoPlayer_PropertyChanged(object? sender, PropertyChangedEventArgs e)
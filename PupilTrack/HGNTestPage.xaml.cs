@@ -4,7 +4,11 @@ using Microsoft.Maui.Devices; // For DeviceInfo and DevicePlatform
 using System;
 using System.IO;
 using System.Net.Http;
+using System.Collections.Generic;
+using System.Net;
 using System.Net.Http.Headers;
+using System.Security.Cryptography;
+using System.Text.Json;
 using System.Threading;
 using System.Threading.Tasks;
 
@@ -20,8 +24,15 @@ namespace PupilTrack
         private bool isRecording = false;
         private string recordedVideoPath;
 
-        // Folder where processed videos are stored (Adjust this path if needed)
-        private const string ProcessedFolderPath = @"C:\Users\dswsm\source\repos\smith8dk\PupilTrackMAUI\PupilTrack\Resources\python\processed\";
+        // How often to ask the server for the status of a processing job.
+        private static readonly TimeSpan JobPollInterval = TimeSpan.FromSeconds(1);
+
+        // Give up on a job whose status and progress have not changed for this long (e.g. one that never starts).
+        private static readonly TimeSpan JobStallTimeout = TimeSpan.FromMinutes(10);
+
+        // Videos are uploaded in chunks of this size, so a dropped connection only costs one chunk.
+        private const int UploadChunkSize = 1024 * 1024;
+        private const int MaxChunkAttempts = 5;
 
         public HGNTestPage()
         {
@@ -133,38 +144,32 @@ namespace PupilTrack
             VideoWebView.IsVisible = true;
         }
 
-        // Uploads the video to the Flask server for stabilization and processing.
+        // Uploads the video to the Flask server, waits for the processing job and opens the results.
         private async Task UploadVideoAsync(string videoPath)
         {
             ShowLoadingScreen();
             ProgressIndicator.IsVisible = true;
             ProgressIndicator.IsRunning = true;
 
-            var fileBytes = await File.ReadAllBytesAsync(videoPath);
-            var videoContent = new ByteArrayContent(fileBytes);
-            videoContent.Headers.ContentType = new MediaTypeHeaderValue("multipart/form-data");
-
             using var client = new HttpClient();
-            var formContent = new MultipartFormDataContent();
-            formContent.Add(videoContent, "file", "video.mp4");
+
+            double[] movementTimestamps = null;
+            string errorMessage = null;
 
             try
             {
-                var response = await client.PostAsync($"{ServerUrl}/stabilize", formContent);
-                if (response.IsSuccessStatusCode)
-                {
-                    var jsonResponse = await response.Content.ReadAsStringAsync();
-                    var videoUrl = ExtractVideoUrlFromResponse(jsonResponse);
-                    await DownloadVideoAsync(videoUrl);
-                }
-                else
-                {
-                    // If response is not successful, log error.
-                }
+                // The server starts processing while the chunks are still arriving.
+                string jobId = await UploadInChunksAsync(client, videoPath);
+
+                string resultJson = await WaitForJobResultAsync(client, jobId);
+                using JsonDocument resultDoc = JsonDocument.Parse(resultJson);
+                movementTimestamps = ExtractMovementTimestamps(resultDoc.RootElement);
+                string videoUrl = resultDoc.RootElement.GetProperty("video_url").GetString();
+                await DownloadVideoAsync(videoUrl);
             }
             catch (Exception ex)
             {
-                // Log error if necessary.
+                errorMessage = ex.Message;
             }
             finally
             {
@@ -172,35 +177,164 @@ namespace PupilTrack
                 ProgressIndicator.IsRunning = false;
             }
 
-            // Wait 5 seconds for the video to fully process.
-            if (await CheckForProcessedVideoAsync())
+            if (errorMessage == null)
             {
-                await Navigation.PushAsync(new HGNResultsPage());
+                await Navigation.PushAsync(new HGNResultsPage(localFilePath, movementTimestamps));
             }
             else
             {
                 HideLoadingScreen();
-                await DisplayAlert("Error", "Processed video not found.", "OK");
+                await DisplayAlert("Error", $"Video processing failed: {errorMessage}", "OK");
+            }
+        }
+
+        // Uploads the video through the resumable upload endpoints and returns the job ID.
+        // A failed chunk is retried from the offset the server reports, so only the missing bytes are resent.
+        private async Task<string> UploadInChunksAsync(HttpClient client, string videoPath)
+        {
+            string sha256;
+            using (var hashStream = File.OpenRead(videoPath))
+            {
+                sha256 = Convert.ToHexString(await SHA256.HashDataAsync(hashStream)).ToLowerInvariant();
+            }
+
+            var createResponse = await client.PostAsync($"{ServerUrl}/uploads", new FormUrlEncodedContent(
+                new Dictionary<string, string>
+                {
+                    ["filename"] = Path.GetFileName(videoPath),
+                    ["sha256"] = sha256
+                }));
+            createResponse.EnsureSuccessStatusCode();
+            using JsonDocument createDoc = JsonDocument.Parse(await createResponse.Content.ReadAsStringAsync());
+            string jobId = createDoc.RootElement.GetProperty("job_id").GetString();
+
+            // The server has already processed this exact video; nothing to upload.
+            if (!createDoc.RootElement.TryGetProperty("upload_url", out JsonElement uploadUrlElement))
+                return jobId;
+            string uploadUrl = uploadUrlElement.GetString();
+
+            using var videoStream = File.OpenRead(videoPath);
+            var buffer = new byte[UploadChunkSize];
+            long offset = 0;
+            int failedAttempts = 0;
+            while (offset < videoStream.Length)
+            {
+                videoStream.Seek(offset, SeekOrigin.Begin);
+                int count = await videoStream.ReadAsync(buffer, 0, buffer.Length);
+                LoadingLabel.Text = $"Uploading video... ({offset * 100 / videoStream.Length}%)";
+
+                try
+                {
+                    var chunkContent = new ByteArrayContent(buffer, 0, count);
+                    chunkContent.Headers.ContentType = new MediaTypeHeaderValue("application/octet-stream");
+                    var chunkResponse = await client.PutAsync($"{uploadUrl}?offset={offset}", chunkContent);
+                    if (chunkResponse.IsSuccessStatusCode || chunkResponse.StatusCode == HttpStatusCode.Conflict)
+                    {
+                        // On a conflict the server reports how much it actually has; continue from there.
+                        using JsonDocument chunkDoc = JsonDocument.Parse(await chunkResponse.Content.ReadAsStringAsync());
+                        offset = chunkDoc.RootElement.GetProperty("offset").GetInt64();
+                        failedAttempts = 0;
+                        continue;
+                    }
+                    if ((int)chunkResponse.StatusCode < 500)
+                        throw new InvalidOperationException($"Upload failed: {chunkResponse.StatusCode}");
+                }
+                catch (HttpRequestException) when (failedAttempts + 1 < MaxChunkAttempts)
+                {
+                    // Connection dropped; fall through and ask the server where to resume.
+                }
+
+                if (++failedAttempts >= MaxChunkAttempts)
+                    throw new HttpRequestException("Upload failed: the server stopped accepting chunks.");
+                await Task.Delay(TimeSpan.FromSeconds(failedAttempts));
+                try
+                {
+                    var statusJson = await client.GetStringAsync(uploadUrl);
+                    using JsonDocument statusDoc = JsonDocument.Parse(statusJson);
+                    offset = statusDoc.RootElement.GetProperty("offset").GetInt64();
+                }
+                catch (HttpRequestException)
+                {
+                    // Still unreachable; retry the same chunk.
+                }
             }
+
+            var completeResponse = await client.PostAsync($"{uploadUrl}/complete", new FormUrlEncodedContent(
+                new Dictionary<string, string> { ["total_size"] = videoStream.Length.ToString() }));
+            completeResponse.EnsureSuccessStatusCode();
+            return jobId;
         }
 
-        // Extracts the processed video URL from the JSON response.
-        private string ExtractVideoUrlFromResponse(string jsonResponse)
+        // Polls the job status endpoint until processing finishes and returns the results JSON.
+        // Throws a TimeoutException if the job makes no progress for JobStallTimeout.
+        private async Task<string> WaitForJobResultAsync(HttpClient client, string jobId)
         {
-            jsonResponse = jsonResponse.Trim().Replace("\\n", "").Replace("\\", "");
-            var startIndex = jsonResponse.IndexOf("\"video_url\":\"") + 13;
-            var endIndex = jsonResponse.IndexOf("\"", startIndex);
-            return jsonResponse[startIndex..endIndex];
+            string lastProgress = null;
+            DateTime deadline = DateTime.UtcNow + JobStallTimeout;
+            while (true)
+            {
+                var statusJson = await client.GetStringAsync($"{ServerUrl}/jobs/{jobId}");
+                using JsonDocument statusDoc = JsonDocument.Parse(statusJson);
+                var status = statusDoc.RootElement;
+                string state = status.GetProperty("status").GetString();
+
+                if (state == "done")
+                {
+                    return await client.GetStringAsync($"{ServerUrl}/jobs/{jobId}/result");
+                }
+                if (state == "failed")
+                {
+                    string error = status.TryGetProperty("error", out JsonElement errorElement)
+                        ? errorElement.GetString()
+                        : "unknown error";
+                    throw new InvalidOperationException(error);
+                }
+
+                int framesProcessed = status.GetProperty("frames_processed").GetInt32();
+                int framesTotal = status.GetProperty("frames_total").GetInt32();
+                string progress = $"{state} {framesProcessed}";
+                if (progress != lastProgress)
+                {
+                    lastProgress = progress;
+                    deadline = DateTime.UtcNow + JobStallTimeout;
+                }
+                else if (DateTime.UtcNow > deadline)
+                {
+                    throw new TimeoutException($"The server made no progress on the video for {JobStallTimeout.TotalMinutes} minutes.");
+                }
+                LoadingLabel.Text = framesTotal > 0
+                    ? $"Processing video, please wait... ({framesProcessed}/{framesTotal} frames)"
+                    : "Processing video, please wait...";
+
+                await Task.Delay(JobPollInterval);
+            }
         }
 
-        // Downloads the processed video from the Flask server.
+        // Reads the sudden movement timestamps from a results JSON document.
+        private static double[] ExtractMovementTimestamps(JsonElement results)
+        {
+            if (!results.TryGetProperty("sudden_movements", out JsonElement movementArray))
+                return Array.Empty<double>();
+
+            double[] timestamps = new double[movementArray.GetArrayLength()];
+            int index = 0;
+            foreach (JsonElement element in movementArray.EnumerateArray())
+            {
+                timestamps[index++] = element.GetDouble();
+            }
+            return timestamps;
+        }
+
+        // Downloads the processed video from the Flask server, streaming it to disk rather than into memory.
         private async Task DownloadVideoAsync(string videoUrl)
         {
             using var client = new HttpClient();
-            var videoData = await client.GetByteArrayAsync(videoUrl);
-
             localFilePath = Path.Combine(FileSystem.AppDataDirectory, "stabilized_video.mp4");
-            await File.WriteAllBytesAsync(localFilePath, videoData);
+            using (var videoStream = await client.GetStreamAsync(videoUrl))
+            using (var fileStream = File.Create(localFilePath))
+            {
+                await videoStream.CopyToAsync(fileStream);
+            }
 
             // Optionally display the processed video.
             ShowProcessedVideo(localFilePath);
@@ -257,23 +391,5 @@ namespace PupilTrack
                 await UploadVideoAsync(fileResult.FullPath);
             }
         }
-
-        // Checks if a processed video exists in the processed folder.
-        private async Task<bool> CheckForProcessedVideoAsync()
-        {
-            await Task.Delay(5000);
-
-            if (Directory.Exists(ProcessedFolderPath))
-            {
-                var files = Directory.GetFiles(ProcessedFolderPath, "*.mp4");
-                if (files.Length > 0)
-                {
-                    Array.Sort(files, (a, b) => File.GetLastWriteTime(b).CompareTo(File.GetLastWriteTime(a)));
-                    localFilePath = files[0];
-                    return true;
-                }
-            }
-            return false;
-        }
     }
 }
@@ -0,0 +1,90 @@
+"""
+Load-test a running server and report requests per second and latency percentiles.
+
+Sends GET requests from a number of concurrent clients, each on its own keep-alive connection, and times
+each one until its whole body has been read. By default it downloads the newest video in processed/,
+like the app does after a job finishes; pass --url to test something else, e.g. a /jobs/<id> status poll.
+
+    python bench_server.py [--url http://127.0.0.1:5000/processed/<name>.mp4] [--requests 500]
+                           [--concurrency 16] [--range 0-1048575]
+
+Start the server first, e.g. with gunicorn -c gunicorn.conf.py wsgi:app (see wsgi.py).
+"""
+import argparse
+import glob
+import http.client
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def run_client(url, count, byte_range, latencies, errors, lock):
+    """Send 'count' requests over one keep-alive connection, recording latencies and failed requests."""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = {"Range": f"bytes={byte_range}"} if byte_range else {}
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(parts.netloc, timeout=60)
+    received = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            received += len(response.read())
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection.close()
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+    connection.close()
+    return received
+
+def main():
+    videos = sorted(glob.glob(os.path.join(base_dir, "processed", "*.mp4")), key=os.path.getmtime)
+    default_url = (f"http://127.0.0.1:5000/processed/{quote(os.path.basename(videos[-1]))}" if videos else None)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=default_url, help="URL to request")
+    parser.add_argument("--requests", type=int, default=500, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--range", dest="byte_range", help="request only this byte range, e.g. 0-1048575")
+    args = parser.parse_args()
+    if args.url is None:
+        parser.error("no URL given and no video found in processed/")
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    # Spread the requests over the clients as evenly as possible.
+    counts = [args.requests // args.concurrency + (1 if k < args.requests % args.concurrency else 0)
+              for k in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        received = sum(pool.map(lambda count: run_client(args.url, count, args.byte_range, latencies, errors, lock),
+                                counts))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.url}: {args.requests} requests, {args.concurrency} concurrent, {elapsed:.2f} s")
+    print(f"requests/s: {args.requests / elapsed:10.1f}")
+    print(f"MB/s:       {received / elapsed / 1e6:10.1f}")
+    if latencies:
+        latencies.sort()
+        print(f"latency ms: p50 {percentile(latencies, 0.50) * 1000:.1f}  "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f}  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}  max {latencies[-1] * 1000:.1f}")
+    print(f"errors:     {len(errors)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark the per-frame pupil segmentation on one of the sample clips in processed/.
+
+Runs the original per-frame code (zoom the whole frame, crop, Otsu, rebuild the ROI mask, draw on a
+fresh canvas) and PupilSegmenter over the same frames and reports frames per second for each, and how
+many centroids moved by more than a pixel. The results are not bit-identical: PupilSegmenter converts
+to grayscale before zooming, which rounds differently, so centroids may shift by up to a pixel.
+Frames are decoded into memory first, so only segmentation and drawing the output frame are timed;
+stabilization and encoding are not.
+
+    python benchmark_detection.py [--clip processed/<name>.mp4] [--repeat 3]
+"""
+import argparse
+import glob
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+from video_stabilizer import PupilSegmenter, base_dir
+
+DETECTION_PARAMS = {
+    "zoom_factor": 1.2,
+    "roi_width": 900,
+    "roi_height": 300,
+    "vertical_offset": 0.08,
+    "strict_threshold": 50
+}
+
+def legacy_segment(frame, width, height, zoom_factor, roi_width, roi_height, vertical_offset, strict_threshold):
+    """The per-frame body of stabilize_and_detect_movements before PupilSegmenter, for comparison."""
+    zoomed_frame = cv2.resize(frame, None, fx=zoom_factor, fy=zoom_factor, interpolation=cv2.INTER_LINEAR)
+    center_x, center_y = zoomed_frame.shape[1] // 2, zoomed_frame.shape[0] // 2
+    cropped_frame = zoomed_frame[center_y - height // 2 : center_y + height // 2,
+                                 center_x - width // 2 : center_x + width // 2]
+    gray_frame = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2GRAY)
+
+    otsu_thresh, _ = cv2.threshold(gray_frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    strict_thresh = strict_threshold if otsu_thresh > strict_threshold else otsu_thresh
+    _, thresholded_frame = cv2.threshold(gray_frame, strict_thresh, 255, cv2.THRESH_BINARY)
+    inverted_frame = cv2.bitwise_not(thresholded_frame)
+
+    mask = np.zeros_like(inverted_frame)
+    int_offset = int(height * vertical_offset)
+    adjusted_roi_width = int(roi_width * 0.7)
+    adjusted_roi_height = int(roi_height * 1.2)
+    cv2.ellipse(mask, (width // 2, (height // 2) + int_offset),
+                (adjusted_roi_width // 2, adjusted_roi_height // 2), 0, 0, 360, 255, -1)
+    masked_frame = cv2.bitwise_and(inverted_frame, inverted_frame, mask=mask)
+
+    contours, _ = cv2.findContours(masked_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return None
+    largest_contour = max(contours, key=cv2.contourArea)
+
+    largest_cluster_frame = 255 * np.ones_like(gray_frame)
+    cv2.drawContours(largest_cluster_frame, [largest_contour], -1, 0, thickness=cv2.FILLED)
+    color_frame = cv2.cvtColor(largest_cluster_frame, cv2.COLOR_GRAY2BGR)
+
+    centroid = _centroid(largest_contour)
+    if centroid is not None:
+        cv2.circle(color_frame, centroid, 5, (0, 0, 255), -1)
+    return centroid
+
+def segmenter_segment(segmenter, frame):
+    largest_contour = segmenter.segment(frame)
+    if largest_contour is None:
+        return None
+    centroid = _centroid(largest_contour)
+    segmenter.render(largest_contour, centroid)
+    return centroid
+
+def _centroid(contour):
+    M = cv2.moments(contour)
+    if M["m00"] == 0:
+        return None
+    return (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+
+def load_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def time_run(segment, frames, repeat):
+    """Return (best frames per second over 'repeat' runs, centroids of the last run)."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        centroids = [segment(frame) for frame in frames]
+        elapsed = time.perf_counter() - start
+        best = max(best, len(frames) / elapsed)
+    return best, centroids
+
+def main():
+    clips = sorted(glob.glob(os.path.join(base_dir, "processed", "*.mp4")))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", default=clips[-1] if clips else None, help="video to benchmark on")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per implementation; the best is reported")
+    args = parser.parse_args()
+    if args.clip is None:
+        parser.error("no clip given and none found in processed/")
+
+    frames = load_frames(args.clip)
+    if not frames:
+        parser.error(f"could not decode any frames from {args.clip}")
+    height, width = frames[0].shape[:2]
+    print(f"{os.path.basename(args.clip)}: {len(frames)} frames at {width}x{height}")
+
+    before_fps, before = time_run(lambda frame: legacy_segment(frame, width, height, **DETECTION_PARAMS),
+                                  frames, args.repeat)
+    segmenter = PupilSegmenter(width, height, **DETECTION_PARAMS)
+    after_fps, after = time_run(lambda frame: segmenter_segment(segmenter, frame), frames, args.repeat)
+
+    print(f"before: {before_fps:8.1f} frames/s")
+    print(f"after:  {after_fps:8.1f} frames/s  ({after_fps / before_fps:.2f}x)")
+
+    # Converting to grayscale before zooming only changes rounding, so centroids are compared with a 1 px
+    # tolerance rather than for equality.
+    differing = sum(1 for a, b in zip(before, after)
+                    if (a is None) != (b is None) or (a is not None and math.dist(a, b) > 1))
+    print(f"centroids differing by more than 1 px: {differing} of {len(frames)} frames")
+
+if __name__ == '__main__':
+    main()
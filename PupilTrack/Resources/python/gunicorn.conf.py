@@ -0,0 +1,38 @@
+"""
+gunicorn settings for the production server; see wsgi.py.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Overridable through environment variables: PUPILTRACK_BIND (default 0.0.0.0:5000), PUPILTRACK_WEB_WORKERS
+(default 2) and PUPILTRACK_THREADS (threads per web worker, default 8).
+"""
+import os
+
+bind = os.environ.get("PUPILTRACK_BIND", "0.0.0.0:5000")
+
+# Web workers only receive uploads and answer status polls and downloads; the video processing runs in
+# each worker's job worker pool, which gets an equal share of the CPUs (see post_worker_init). The pools
+# are separate, so one cannot use the share of an idle sibling: with 2 web workers on 4 CPUs a single
+# video, even split into segments, is processed on at most 2 of them. Where single long videos matter
+# more than many concurrent uploads, run one web worker; its threads still serve many requests at once.
+workers = int(os.environ.get("PUPILTRACK_WEB_WORKERS", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("PUPILTRACK_THREADS", 8))
+
+# Import the app (and with it OpenCV, VidStab and NumPy) once in the master, before forking the workers.
+preload_app = True
+
+# The app polls job status every second; keep its connection open between polls.
+keepalive = 5
+
+# Send finished videos and results with sendfile(2).
+sendfile = True
+
+accesslog = "-"
+
+def post_worker_init(worker):
+    # Each web worker starts its own job workers, which warm up before the first request arrives. This runs
+    # after the worker has installed its signal handlers (post_fork runs before, while the master's are still
+    # in place); the job workers reset them to the defaults anyway, so SIGTERM stops them.
+    from video_stabilizer import start_job_workers
+    start_job_workers(web_workers=workers)
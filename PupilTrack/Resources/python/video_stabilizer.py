@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, url_for, send_from_directory
 from werkzeug.utils import secure_filename
 from vidstab import VidStab
 from flask_cors import CORS
@@ -8,6 +8,36 @@ import time
 import numpy as np
 import math
 import json
+import hashlib
+import uuid
+import re
+import threading
+import io
+import shutil
+import struct
+import itertools
+import sys
+import signal
+from contextlib import contextmanager
+from collections import namedtuple
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    # File locks shared by the server processes and the job workers (see _locked); msvcrt on Windows.
+    import fcntl
+    msvcrt = None
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+try:
+    # PyAV is only needed to decode uploads while they are still arriving; without it,
+    # chunked uploads are processed once they are complete.
+    import av
+except ImportError:
+    av = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -17,138 +47,1364 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 app.config['UPLOAD_FOLDER'] = os.path.join(base_dir, "uploads")
 app.config['PROCESSED_FOLDER'] = os.path.join(base_dir, "processed")
 saved_folder = os.path.join(base_dir, "saved")
+jobs_folder = os.path.join(base_dir, "jobs")
+cache_folder = os.path.join(base_dir, "cache")
+metrics_folder = os.path.join(base_dir, "metrics")
+
+# Number of videos processed in parallel; each job runs in its own worker process.
+app.config['JOB_WORKERS'] = os.cpu_count() or 1
+
+# Finished jobs are kept as a result cache until they are older than CACHE_MAX_AGE seconds,
+# or, least recently used first, until their files fit in CACHE_MAX_BYTES.
+app.config['CACHE_MAX_BYTES'] = 2 * 1024 ** 3
+app.config['CACHE_MAX_AGE'] = 7 * 24 * 60 * 60
+
+# A chunked upload that receives no data for this many seconds is abandoned and its job fails.
+app.config['UPLOAD_IDLE_TIMEOUT'] = 300
 
 # Ensure folders exist.
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
 os.makedirs(saved_folder, exist_ok=True)
+os.makedirs(jobs_folder, exist_ok=True)
+os.makedirs(cache_folder, exist_ok=True)
+os.makedirs(metrics_folder, exist_ok=True)
 
-def stabilize_and_detect_movements(input_path, output_path, zoom_factor=1.2, roi_width=900, roi_height=300, 
-                                    movement_threshold=30, cooldown=0.3, vertical_offset=0.08,
-                                    strict_threshold=50):
+# Job IDs are uuid4 hex strings; anything else is rejected before it reaches the filesystem.
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Worker pool for /stabilize jobs, created on first use so that it is never inherited across a fork.
+_executor = None
+# Threads that split jobs into segments for the worker pool and put the results back together.
+_coordinator_executor = None
+_executor_lock = threading.Lock()
+
+# Serializes the offset check and write of chunked uploads, so a retried chunk cannot be appended twice;
+# see _upload_locked.
+_upload_lock = threading.Lock()
+
+# Serializes updates to the metrics file between threads; see _record_job_metrics.
+_metrics_lock = threading.Lock()
+
+# Ways the annotated output video can be produced; see stabilize_and_detect_movements.
+RENDER_MODES = ("none", "lowres", "full")
+
+# An opened video: an iterator of BGR frames, its properties, and a function that closes it.
+# 'frame_count' is 0 when the container does not say.
+VideoSource = namedtuple("VideoSource", ["frames", "fps", "width", "height", "frame_count", "release"])
+
+class StageTimer:
     """
-    Stabilize a video, process it in grayscale with a strict binary threshold (only very dark pixels become black),
-    and detect sudden movements.
+    Wall-clock time spent in each stage of processing one video, plus the number of frames processed
+    and the peak memory, for the 'timings' block of the results and /metrics.
     
-    The function applies an elliptical ROI with a vertical offset (as a fraction of the frame height)
-    to help exclude the eyebrow region from the thresholding. It isolates the largest cluster and tracks its centroid.
-    If the centroid moves more than 'movement_threshold' pixels and the cooldown period has passed,
-    it registers the movement.
-    
-    Returns a list of timestamps (in seconds) when sudden movement was detected.
+    Stages: upload_save, decode, stabilize, resize_crop, threshold, contours, encode (drawing and writing
+    the annotated video) and json_write, plus concatenate when a video is processed in segments.
     """
-    stabilizer = VidStab()
-    temp_stabilized_path = os.path.join(os.path.dirname(input_path), "temp_stabilized.mp4")
     
-    # Stabilize the video.
-    stabilizer.stabilize(input_path=input_path, output_path=temp_stabilized_path)
+    def __init__(self):
+        self.seconds = {}
+        self.frames = 0
+        self.peak_memory_bytes = None
     
-    cap = cv2.VideoCapture(temp_stabilized_path)
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264 codec
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height), isColor=True)
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
     
-    sudden_movements = []
-    previous_centroid = None
-    last_detection_time = -cooldown  # Ensures immediate first detection
-    frame_index = 0
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
     
+    def timed(self, name, iterable):
+        """Yield the items of 'iterable', counting the time spent producing each one towards 'name'."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(name, time.perf_counter() - start)
+            yield item
+    
+    def merge(self, seconds, peak_memory_bytes):
+        """Add the stage times and peak memory measured by another process (e.g. one segment)."""
+        for name, value in seconds.items():
+            self.add(name, value)
+        if peak_memory_bytes is not None:
+            self.peak_memory_bytes = max(self.peak_memory_bytes or 0, peak_memory_bytes)
+
+def _reset_peak_memory():
+    # Pool workers are reused, so their lifetime peak would not say anything about the current job.
+    # Linux can reset the peak ('VmHWM') of the calling process; elsewhere the lifetime peak is reported.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _peak_memory_bytes():
+    """Peak resident memory of this process since the last _reset_peak_memory, or None if unknown."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _read_frames(cap):
+    """Yield frames from an open cv2.VideoCapture until it runs out."""
     while cap.isOpened():
         ret, frame = cap.read()
         if not ret:
             break
+        yield frame
+
+def _open_video(path, start_frame=0):
+    cap = cv2.VideoCapture(path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    return VideoSource(_read_frames(cap), int(cap.get(cv2.CAP_PROP_FPS)),
+                       int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                       int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), cap.release)
+
+def _wait_for_upload_data(path, size, upload_complete, timeout, poll_interval=0.2):
+    """
+    Block until the file at 'path' is larger than 'size' bytes or the upload is complete.
+    
+    Returns True if there is more data to read and False once the upload is complete and there is not.
+    Raises TimeoutError if the file does not grow for 'timeout' seconds.
+    """
+    idle = 0.0
+    while True:
+        if os.path.getsize(path) > size:
+            return True
+        if upload_complete():
+            # Chunks may have landed between the size check and the completion check.
+            return os.path.getsize(path) > size
+        if idle >= timeout:
+            raise TimeoutError(f"No upload data received for {timeout} seconds.")
+        time.sleep(poll_interval)
+        idle += poll_interval
+
+class GrowingFile(io.RawIOBase):
+    """
+    Read-only, forward-only view of a file that chunks are still being appended to.
+    
+    Reads block until data is available and only report end of file once 'upload_complete()' is true,
+    so a decoder can consume an upload while the rest of it is still arriving.
+    """
+    
+    def __init__(self, path, upload_complete, timeout):
+        self._file = open(path, "rb", buffering=0)
+        self._path = path
+        self._upload_complete = upload_complete
+        self._timeout = timeout
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while True:
+            count = self._file.readinto(buffer)
+            if count:
+                return count
+            if not _wait_for_upload_data(self._path, self._file.tell(), self._upload_complete, self._timeout):
+                return 0
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+def _upload_layout(path):
+    """
+    Whether an upload can be decoded before it is complete, judged from the part of it at 'path' so far.
+    
+    MP4/QuickTime files need their index ('moov' box) before any frame can be decoded. Recorders
+    usually write it at the end, after the media data ('mdat'), in which case the whole upload is
+    needed first. Files with the index up front (fast start) or fragmented MP4 can be streamed,
+    as can containers that are not MP4 at all, such as Matroska/WebM or MPEG-TS.
+    
+    Returns True or False, or None if not enough of the file has arrived to tell. Only reads the box
+    headers, so it is cheap enough to call after every chunk.
+    """
+    if av is None:
+        return False
+    
+    with open(path, "rb") as f:
+        position = 0
+        first_box = True
+        while True:
+            f.seek(position)
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            size, box_type = struct.unpack(">I4s", header)
+            if first_box and box_type != b"ftyp":
+                return True
+            first_box = False
+            if box_type in (b"moov", b"moof"):
+                return True
+            if box_type == b"mdat" or size == 0:
+                return False
+            header_size = 8
+            if size == 1:
+                large_size = f.read(8)
+                if len(large_size) < 8:
+                    return None
+                size = struct.unpack(">Q", large_size)[0]
+                header_size = 16
+            # Boxes ahead of the index are small (ftyp, free, uuid); skip to the next header.
+            position += max(size, header_size)
+
+def _can_decode_while_uploading(path, upload_complete, timeout):
+    """
+    Whether the upload can be decoded before it is complete (see _upload_layout), waiting for more of
+    it while that cannot be told yet.
+    """
+    while True:
+        layout = _upload_layout(path)
+        if layout is not None:
+            return layout
+        if not _wait_for_upload_data(path, os.path.getsize(path), upload_complete, timeout):
+            # The upload ended before any index; it is complete, so let the decoder have it.
+            return True
+
+def _open_growing_video(path, upload_complete, timeout):
+    """Open an upload that is still arriving with PyAV, decoding frames as their data comes in."""
+    container = av.open(GrowingFile(path, upload_complete, timeout))
+    stream = container.streams.video[0]
+    rate = stream.average_rate or stream.guessed_rate or 30
+    frames = (frame.to_ndarray(format="bgr24") for frame in container.decode(stream))
+    return VideoSource(frames, int(rate), stream.codec_context.width, stream.codec_context.height,
+                       stream.frames or 0, container.close)
+
+def _stabilized_frames(frames, smoothing_window=30, timer=None):
+    """
+    Stabilize an iterator of frames one at a time with VidStab.stabilize_frame.
+    
+    VidStab works on a 'smoothing_window' frame delay: the first 'smoothing_window' frames it returns
+    are blank warm-up frames, and the frames still queued at the end are flushed by passing None.
+    Only real stabilized frames are yielded, in input order (VidStab does not flush the very last frame).
+    Like VidStab.stabilize, this needs more than 'smoothing_window' frames and raises ValueError otherwise.
+    """
+    if timer is None:
+        timer = StageTimer()
+    stabilizer = VidStab()
+    warmup_frames = smoothing_window
+    frames = iter(frames)
+    
+    while True:
+        frame = next(frames, None)
+        if frame is None and warmup_frames > 0:
+            # VidStab keeps returning blank frames forever if the video ends during warm-up.
+            raise ValueError(f"Video is too short to stabilize with a smoothing window of {smoothing_window} frames.")
+        with timer.stage("stabilize"):
+            stabilized_frame = stabilizer.stabilize_frame(input_frame=frame, smoothing_window=smoothing_window)
+        if stabilized_frame is None:
+            break
+        if warmup_frames > 0:
+            warmup_frames -= 1
+            continue
+        yield stabilized_frame
+
+class PupilSegmenter:
+    """
+    Finds the pupil (the largest very dark cluster inside an elliptical ROI) in the frames of one video.
+    
+    Everything that only depends on the frame size and the detection parameters is worked out once here:
+    which source pixels survive the zoom-and-crop, the elliptical ROI mask and its bounding box. Per frame,
+    only that source region is converted to grayscale and zoomed, only the ROI's bounding box is thresholded
+    and searched for contours, and every intermediate image is written into a buffer allocated here.
+    
+    Time spent per step is added to 'timer' (a StageTimer), if given.
+    """
+    
+    def __init__(self, width, height, zoom_factor=1.2, roi_width=900, roi_height=300,
+                 vertical_offset=0.08, strict_threshold=50, timer=None):
+        self.timer = timer if timer is not None else StageTimer()
+        self.zoom_factor = zoom_factor
+        self.strict_threshold = strict_threshold
         
-        current_timestamp = frame_index / fps
-        
-        # Zoom the frame.
-        zoomed_frame = cv2.resize(frame, None, fx=zoom_factor, fy=zoom_factor, interpolation=cv2.INTER_LINEAR)
-        center_x, center_y = zoomed_frame.shape[1] // 2, zoomed_frame.shape[0] // 2
-        
-        # Crop the center.
-        crop_width = width
-        crop_height = height
-        cropped_frame = zoomed_frame[center_y - crop_height // 2 : center_y + crop_height // 2,
-                                     center_x - crop_width // 2 : center_x + crop_width // 2]
-        
-        # Convert to grayscale.
-        gray_frame = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2GRAY)
-        
-        # Get Otsu's threshold value.
-        otsu_thresh, _ = cv2.threshold(gray_frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        # Enforce strict threshold if Otsu's value is too high.
-        strict_thresh = strict_threshold if otsu_thresh > strict_threshold else otsu_thresh
-        _, thresholded_frame = cv2.threshold(gray_frame, strict_thresh, 255, cv2.THRESH_BINARY)
-        
-        # Invert colors (so pupil, which is dark, becomes white).
-        inverted_frame = cv2.bitwise_not(thresholded_frame)
+        # The frame is zoomed by 'zoom_factor' and the centre is cropped back to the original size
+        # (rounded down to even dimensions).
+        crop_width = (width // 2) * 2
+        crop_height = (height // 2) * 2
+        self.crop_size = (crop_width, crop_height)
+        src_x0, src_x1, crop_x = self._zoom_source_span(width, crop_width, zoom_factor)
+        src_y0, src_y1, crop_y = self._zoom_source_span(height, crop_height, zoom_factor)
+        self.src_region = (slice(src_y0, src_y1), slice(src_x0, src_x1))
         
-        # Create an empty mask.
-        mask = np.zeros_like(inverted_frame)
+        self.src_gray = np.empty((src_y1 - src_y0, src_x1 - src_x0), dtype=np.uint8)
+        zoomed_size = (round((src_x1 - src_x0) * zoom_factor), round((src_y1 - src_y0) * zoom_factor))
+        self.zoomed = np.empty((zoomed_size[1], zoomed_size[0]), dtype=np.uint8)
+        # The crop is a fixed view into the zoom buffer, so it never has to be copied out.
+        self.gray = self.zoomed[crop_y:crop_y + crop_height, crop_x:crop_x + crop_width]
+        self.otsu_scratch = np.empty_like(self.gray)
+        self.canvas = np.empty((crop_height, crop_width, 3), dtype=np.uint8)
         
-        # Calculate a vertical offset (in pixels) to shift the ROI downward.
+        # Elliptical ROI, shifted downward (by a fraction of the frame height) to exclude eyebrows.
+        mask = np.zeros((crop_height, crop_width), dtype=np.uint8)
         int_offset = int(height * vertical_offset)
-        
-        # Adjust ROI dimensions.
         adjusted_roi_width = int(roi_width * 0.7)
         adjusted_roi_height = int(roi_height * 1.2)
-        
-        # Define an elliptical ROI, shifted downward to exclude eyebrows.
         int_roi_x = width // 2
         int_roi_y = (height // 2) + int_offset
         cv2.ellipse(mask, (int_roi_x, int_roi_y), (adjusted_roi_width // 2, adjusted_roi_height // 2), 0, 0, 360, 255, -1)
         
-        # Apply the mask.
-        masked_frame = cv2.bitwise_and(inverted_frame, inverted_frame, mask=mask)
+        # Nothing outside the ellipse can be part of a contour, so thresholding and the contour search only
+        # look at its bounding box, padded by a pixel so contours see the same background as in the full frame.
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            self.roi_region = None
+        else:
+            roi_y0, roi_y1 = max(0, rows[0] - 1), min(crop_height, rows[-1] + 2)
+            roi_x0, roi_x1 = max(0, cols[0] - 1), min(crop_width, cols[-1] + 2)
+            self.roi_region = (slice(roi_y0, roi_y1), slice(roi_x0, roi_x1))
+            self.roi_offset = (int(roi_x0), int(roi_y0))
+            self.roi_mask = mask[self.roi_region].copy()
+            self.binary = np.empty_like(self.roi_mask)
+    
+    @staticmethod
+    def _zoom_source_span(size, crop_size, zoom_factor):
+        """
+        Work out, along one axis, which source pixels are needed for the zoomed centre crop.
+        
+        Returns (start, stop, offset): zooming source[start:stop] with cv2.resize and taking 'crop_size'
+        pixels from 'offset' gives the same pixels as zooming the whole axis and cropping its centre.
+        That only holds if 'start' maps to a whole zoomed pixel, so for zoom factors that are not a
+        simple fraction the whole axis is zoomed.
+        """
+        zoomed_size = round(size * zoom_factor)
+        crop_start = zoomed_size // 2 - size // 2
         
-        # Find contours.
-        contours, _ = cv2.findContours(masked_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if len(contours) == 0:
-            frame_index += 1
-            continue
+        ratio = Fraction(zoom_factor).limit_denominator(100)
+        if abs(float(ratio) - zoom_factor) > 1e-9:
+            return 0, size, crop_start
         
-        # Get the largest contour.
-        largest_contour = max(contours, key=cv2.contourArea)
+        # Step back a pixel for interpolation, then down to a multiple of the ratio's denominator.
+        start = math.floor((crop_start + 0.5) / zoom_factor - 0.5) - 1
+        start = max(0, start - start % ratio.denominator)
+        offset = crop_start - int(start * ratio)
+        stop = min(size, math.ceil((crop_start + crop_size) / zoom_factor) + 2)
+        if round((stop - start) * zoom_factor) < offset + crop_size:
+            stop = size
+        return start, stop, offset
+    
+    def segment(self, frame):
+        """Return the largest dark contour inside the ROI of a BGR frame, in crop coordinates, or None."""
+        if self.roi_region is None:
+            return None
         
-        # Create a blank white frame.
-        largest_cluster_frame = 255 * np.ones_like(gray_frame)
+        # Convert and zoom only the part of the frame that survives the crop.
+        with self.timer.stage("resize_crop"):
+            cv2.cvtColor(frame[self.src_region], cv2.COLOR_BGR2GRAY, dst=self.src_gray)
+            # (No dsize: cv2.resize would then derive the scale from the sizes instead of using 'zoom_factor'.)
+            cv2.resize(self.src_gray, None, dst=self.zoomed, fx=self.zoom_factor, fy=self.zoom_factor,
+                       interpolation=cv2.INTER_LINEAR)
         
-        # Draw the largest contour filled with black.
-        cv2.drawContours(largest_cluster_frame, [largest_contour], -1, 0, thickness=cv2.FILLED)
+        with self.timer.stage("threshold"):
+            # Dark pixels (the pupil) become white, then everything outside the ellipse is cleared.
+            roi_gray = self.gray[self.roi_region]
+            cv2.threshold(roi_gray, self.strict_threshold, 255, cv2.THRESH_BINARY_INV, dst=self.binary)
+            cv2.bitwise_and(self.binary, self.roi_mask, dst=self.binary)
+            
+            # Otsu's level only matters if it is below the strict threshold, where it could only shrink
+            # the selection further, so it is skipped when the strict threshold already selects nothing.
+            if not cv2.countNonZero(self.binary):
+                return None
+            otsu_thresh, _ = cv2.threshold(self.gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                                           dst=self.otsu_scratch)
+            if otsu_thresh < self.strict_threshold:
+                cv2.threshold(roi_gray, otsu_thresh, 255, cv2.THRESH_BINARY_INV, dst=self.binary)
+                cv2.bitwise_and(self.binary, self.roi_mask, dst=self.binary)
         
-        # Convert the frame to color to overlay a red dot.
-        color_frame = cv2.cvtColor(largest_cluster_frame, cv2.COLOR_GRAY2BGR)
+        with self.timer.stage("contours"):
+            contours, _ = cv2.findContours(self.binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                           offset=self.roi_offset)
+            if len(contours) == 0:
+                return None
+            return max(contours, key=cv2.contourArea)
+    
+    def render(self, contour, centroid=None):
+        """Draw the output frame: the contour filled black on white, with a red dot at the centroid."""
+        self.canvas.fill(255)
+        cv2.drawContours(self.canvas, [contour], -1, (0, 0, 0), thickness=cv2.FILLED)
+        if centroid is not None:
+            cv2.circle(self.canvas, centroid, 5, (0, 0, 255), -1)
+        return self.canvas
+
+def stabilize_and_detect_movements(input_path, output_path, zoom_factor=1.2, roi_width=900, roi_height=300, 
+                                    movement_threshold=30, cooldown=0.3, vertical_offset=0.08,
+                                    strict_threshold=50, streaming=True, smoothing_window=30,
+                                    progress=None, progress_interval=30,
+                                    render="full", preview_scale=0.5, preview_fps=10,
+                                    upload_complete=None, upload_timeout=300, segments=1, executor=None,
+                                    timer=None, trajectory_path=None):
+    """
+    Stabilize a video, process it in grayscale with a strict binary threshold (only very dark pixels become black),
+    and detect sudden movements.
+    
+    The function applies an elliptical ROI with a vertical offset (as a fraction of the frame height)
+    to help exclude the eyebrow region from the thresholding. It isolates the largest cluster and tracks its centroid.
+    If the centroid moves more than 'movement_threshold' pixels and the cooldown period has passed,
+    it registers the movement.
+    
+    With 'streaming' enabled (the default) each frame is stabilized as it is decoded and handed straight to
+    detection, so the upload is decoded once and no intermediate video is written. With 'streaming' disabled
+    the whole video is first stabilized to a uniquely named temporary file next to the input and read back.
+    
+    If 'progress' is given it is called as progress(frames_processed, frames_total) every 'progress_interval'
+    frames and once more at the end. 'frames_total' is the container's frame count and may be 0 if unknown.
+    
+    'render' controls the annotated video written to 'output_path':
+      - "full": every annotated frame at full resolution (the default);
+      - "lowres": a preview scaled by 'preview_scale' with about 'preview_fps' frames per second;
+      - "none": nothing is drawn or encoded, and 'output_path' is ignored.
+    Detection runs on the full-resolution frames in every mode, so the timestamps are the same.
+    
+    'upload_complete' is for inputs that are still being uploaded: a function that returns True once the
+    last chunk has been written. When the container allows it (and PyAV is installed), frames are decoded
+    and processed as they arrive; otherwise processing starts once the upload is complete. Either way a
+    TimeoutError is raised if the upload stalls for 'upload_timeout' seconds.
+    
+    With 'segments' > 1 a long video is split into up to that many time segments that are stabilized and
+    tracked in parallel, on 'executor' if given or on a process pool of their own otherwise. Only the number
+    of segments that leaves each several VidStab smoothing windows long is used, and it needs a complete,
+    seekable file, so an upload in progress is waited for first. The timestamps are the same as in a single
+    pass.
+    
+    If 'timer' (a StageTimer) is given, the time spent in each stage and the number of frames are added to it.
+    
+    If 'trajectory_path' is given, the per-frame pupil trajectory (timestamp, centroid, contour area and
+    whether a pupil was found) is saved there as .npz, so that detect_sudden_movements can be rerun with
+    other thresholds without the video; see load_trajectory.
+    
+    Returns a list of timestamps (in seconds) when sudden movement was detected.
+    """
+    if render not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render!r}; expected one of {', '.join(RENDER_MODES)}.")
+    if timer is None:
+        timer = StageTimer()
+    
+    if upload_complete is not None and (segments > 1 or not (
+            streaming and _can_decode_while_uploading(input_path, upload_complete, upload_timeout))):
+        # The decoder needs the whole file, so wait for the rest of the upload.
+        while _wait_for_upload_data(input_path, os.path.getsize(input_path), upload_complete, upload_timeout):
+            pass
+        upload_complete = None
+    
+    if segments > 1:
+        source = _open_video(input_path)
+        source.release()
+        # Each segment pays for its own VidStab warm-up, so segments much shorter than that are not worth it.
+        bounds = _segment_bounds(source.frame_count, segments, min_length=4 * (smoothing_window + 1))
+    # With an 'executor' even a single segment is handed to it, as the caller is not meant to do the work.
+    if segments > 1 and (len(bounds) > 1 or executor is not None):
+        return _stabilize_and_detect_in_segments(input_path, output_path, bounds, source.fps,
+                                                 source.frame_count, executor=executor,
+                                                 zoom_factor=zoom_factor, roi_width=roi_width,
+                                                 roi_height=roi_height, movement_threshold=movement_threshold,
+                                                 cooldown=cooldown, vertical_offset=vertical_offset,
+                                                 strict_threshold=strict_threshold,
+                                                 smoothing_window=smoothing_window, progress=progress,
+                                                 render=render, preview_scale=preview_scale,
+                                                 preview_fps=preview_fps, timer=timer,
+                                                 trajectory_path=trajectory_path)
+    
+    temp_stabilized_path = None
+    if upload_complete is not None:
+        # Decode time includes waiting for chunks that have not arrived yet.
+        source = _open_growing_video(input_path, upload_complete, upload_timeout)
+        frames = _stabilized_frames(timer.timed("decode", source.frames), smoothing_window=smoothing_window,
+                                    timer=timer)
+    elif streaming:
+        source = _open_video(input_path)
+        frames = _stabilized_frames(timer.timed("decode", source.frames), smoothing_window=smoothing_window,
+                                    timer=timer)
+    else:
+        # A per-call name keeps concurrent requests from overwriting each other's intermediate file.
+        base_name, _ = os.path.splitext(os.path.basename(input_path))
+        temp_stabilized_path = os.path.join(os.path.dirname(input_path),
+                                            f"{base_name}_{uuid.uuid4().hex}_stabilized.mp4")
+        stabilizer = VidStab()
+        # This includes decoding the input and encoding the intermediate file.
+        with timer.stage("stabilize"):
+            stabilizer.stabilize(input_path=input_path, output_path=temp_stabilized_path,
+                                 smoothing_window=smoothing_window)
+        source = _open_video(temp_stabilized_path)
+        frames = timer.timed("decode", source.frames)
+    
+    fps = source.fps
+    total_frames = source.frame_count
+    segmenter = PupilSegmenter(source.width, source.height, zoom_factor=zoom_factor, roi_width=roi_width,
+                               roi_height=roi_height, vertical_offset=vertical_offset,
+                               strict_threshold=strict_threshold, timer=timer)
+    out, preview, frame_step = _open_writer(output_path, render, fps, segmenter.crop_size,
+                                            preview_scale, preview_fps)
+    
+    samples = _track_pupil(frames, segmenter, out, preview, frame_step,
+                           progress=progress, progress_interval=progress_interval, total_frames=total_frames)
+    timer.frames += len(samples)
+    
+    source.release()
+    if out is not None:
+        with timer.stage("encode"):
+            out.release()
+    if temp_stabilized_path is not None:
+        os.remove(temp_stabilized_path)
+    
+    if progress is not None:
+        progress(len(samples), max(total_frames, len(samples)))
+    
+    return _finish_trajectory(samples, fps, movement_threshold, cooldown, trajectory_path)
+
+def _finish_trajectory(samples, fps, movement_threshold, cooldown, trajectory_path):
+    trajectory = _trajectory(samples, fps)
+    if trajectory_path is not None:
+        _save_trajectory(trajectory_path, trajectory)
+    return detect_sudden_movements(trajectory, movement_threshold, cooldown)
+
+def _open_writer(output_path, render, fps, crop_size, preview_scale, preview_fps):
+    """
+    Create the writer for the annotated video; see 'render' in stabilize_and_detect_movements.
+    
+    Returns (writer or None, preview buffer or None, frame_step), where only every 'frame_step'-th frame is written.
+    """
+    fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264 codec
+    
+    # The writer is sized to the crop the annotated frames are drawn on.
+    if render == "full":
+        return cv2.VideoWriter(output_path, fourcc, fps, crop_size, isColor=True), None, 1
+    if render == "lowres":
+        frame_step = max(1, round(fps / preview_fps))
+        # H.264 needs even dimensions.
+        preview_size = (max(2, int(crop_size[0] * preview_scale) // 2 * 2),
+                        max(2, int(crop_size[1] * preview_scale) // 2 * 2))
+        preview = np.empty((preview_size[1], preview_size[0], 3), dtype=np.uint8)
+        out = cv2.VideoWriter(output_path, fourcc, fps / frame_step, preview_size, isColor=True)
+        return out, preview, frame_step
+    return None, None, 1
+
+def _track_pupil(frames, segmenter, out=None, preview=None, frame_step=1, first_index=0,
+                 progress=None, progress_interval=30, total_frames=0):
+    """
+    Find the pupil in each frame, writing the annotated frames to 'out' if given.
+    
+    'first_index' is the index of the first frame in the whole video, so that a segment of a video writes
+    the same frames as a single pass would. Returns one (centroid, area) pair per frame: the (cx, cy)
+    centroid of the pupil contour, or None where no pupil was found, and the contour's area in pixels.
+    """
+    samples = []
+    
+    for frame_index, frame in enumerate(frames, start=first_index):
+        if progress is not None and frame_index % progress_interval == 0:
+            progress(frame_index, total_frames)
+        
+        largest_contour = segmenter.segment(frame)
+        if largest_contour is None:
+            samples.append((None, 0.0))
+            continue
         
         # Compute centroid of the largest contour.
+        current_centroid = None
         M = cv2.moments(largest_contour)
         if M["m00"] != 0:
             cx = int(M["m10"] / M["m00"])
             cy = int(M["m01"] / M["m00"])
             current_centroid = (cx, cy)
-            
-            if previous_centroid is not None:
-                dx = current_centroid[0] - previous_centroid[0]
-                dy = current_centroid[1] - previous_centroid[1]
-                distance = math.sqrt(dx * dx + dy * dy)
-                if distance > movement_threshold and (current_timestamp - last_detection_time) >= cooldown:
-                    sudden_movements.append(current_timestamp)
-                    last_detection_time = current_timestamp
-            
-            previous_centroid = current_centroid
-            
-            # Draw a red dot at the centroid.
-            cv2.circle(color_frame, current_centroid, 5, (0, 0, 255), -1)
+        samples.append((current_centroid, cv2.contourArea(largest_contour)))
         
-        out.write(color_frame)
-        frame_index += 1
+        if out is not None and frame_index % frame_step == 0:
+            with segmenter.timer.stage("encode"):
+                color_frame = segmenter.render(largest_contour, current_centroid)
+                if preview is not None:
+                    cv2.resize(color_frame, (preview.shape[1], preview.shape[0]), dst=preview,
+                               interpolation=cv2.INTER_AREA)
+                    color_frame = preview
+                out.write(color_frame)
+    
+    return samples
+
+def _trajectory(samples, fps):
+    """
+    Turn the samples from _track_pupil into per-frame columns: 'timestamp' (seconds), 'cx' and 'cy' (pixels
+    in the cropped frame, -1 where no pupil was found), 'area' (pixels) and 'detected'.
+    """
+    detected = np.array([centroid is not None for centroid, _ in samples], dtype=bool)
+    centroids = np.array([centroid if centroid is not None else (-1, -1) for centroid, _ in samples],
+                         dtype=np.int32).reshape(-1, 2)
+    return {
+        "timestamp": np.arange(len(samples)) / fps,
+        "cx": centroids[:, 0],
+        "cy": centroids[:, 1],
+        "area": np.array([area for _, area in samples], dtype=np.float32),
+        "detected": detected
+    }
+
+def _save_trajectory(path, trajectory):
+    """Write a trajectory (see _trajectory) to a compressed .npz file, one array per column."""
+    np.savez_compressed(path, **trajectory)
+
+def load_trajectory(path):
+    """Read a trajectory written by stabilize_and_detect_movements ('trajectory_path')."""
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+def detect_sudden_movements(trajectory, movement_threshold=30, cooldown=0.3):
+    """
+    Return the timestamps at which the pupil jumped more than 'movement_threshold' pixels since the last
+    frame it was found in, at most one per 'cooldown' seconds (the first jump always counts).
+    
+    Works on a stored trajectory, so thresholds can be tried without touching the video. Distances, and for
+    every jump the next jump outside its cooldown window, are computed for all frames at once; what is
+    left is following those links from the first jump.
+    """
+    detected = trajectory["detected"]
+    timestamps = trajectory["timestamp"][detected]
+    cx = trajectory["cx"][detected].astype(np.int64)
+    cy = trajectory["cy"][detected].astype(np.int64)
+    
+    # Squared integer distances are exact, so the square root matches math.sqrt on the same values.
+    distances = np.sqrt(np.diff(cx) ** 2 + np.diff(cy) ** 2)
+    jump_times = timestamps[1:][distances > movement_threshold]
+    
+    # The binary search compares against t + cooldown, which can round differently from the
+    # (t_next - t) >= cooldown test the cooldown is defined by; settle the boundary with that test.
+    # Timestamps are at least a frame apart, so rounding can only move it by one jump.
+    count = len(jump_times)
+    indices = np.arange(count)
+    next_jump = np.searchsorted(jump_times, jump_times + cooldown)
+    step_back = (next_jump > indices + 1) & (jump_times[np.maximum(next_jump - 1, 0)] - jump_times >= cooldown)
+    next_jump -= step_back
+    step_forward = next_jump < count
+    step_forward[step_forward] = (jump_times[next_jump[step_forward]] - jump_times[step_forward]) < cooldown
+    next_jump += step_forward
+    next_jump = np.maximum(next_jump, indices + 1).tolist()
     
-    cap.release()
-    out.release()
-    os.remove(temp_stabilized_path)
+    sudden_movements = []
+    i = 0
+    while i < count:
+        sudden_movements.append(float(jump_times[i]))
+        i = next_jump[i]
     
     return sudden_movements
 
+def _segment_bounds(total_frames, segments, min_length):
+    """Split [0, total_frames) into up to 'segments' (start, stop) ranges of at least 'min_length' frames."""
+    segments = max(1, min(segments, total_frames // min_length))
+    edges = [total_frames * k // segments for k in range(segments + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _track_segment(input_path, segment_path, start, stop, fps, smoothing_window=30, render="full",
+                   preview_scale=0.5, preview_fps=10, **segmenter_params):
+    """
+    Stabilize frames [start, stop) of a video and find the pupil in each; runs in a pool worker.
+    
+    VidStab smooths the camera trajectory over the previous 'smoothing_window' frames, so the segment is
+    stabilized from 'smoothing_window' + 1 frames before 'start' and those lead-in frames are dropped. That
+    gives the same stabilized frames as a single pass over the whole video. One frame past 'stop' is read as
+    well, because VidStab never returns the last frame it is given. 'stop' is None for the last segment,
+    which runs to the end of the video.
+    
+    Returns (samples of the segment as _track_pupil returns them, StageTimer.seconds, peak memory in bytes).
+    """
+    _reset_peak_memory()
+    timer = StageTimer()
+    lead_in = min(start, smoothing_window + 1)
+    source = _open_video(input_path, start_frame=start - lead_in)
+    frames = timer.timed("decode", source.frames)
+    if stop is not None:
+        frames = itertools.islice(frames, stop - start + lead_in + 1)
+    stabilized = itertools.islice(_stabilized_frames(frames, smoothing_window=smoothing_window, timer=timer),
+                                  lead_in, None if stop is None else lead_in + stop - start)
+    
+    segmenter = PupilSegmenter(source.width, source.height, timer=timer, **segmenter_params)
+    out, preview, frame_step = _open_writer(segment_path, render, fps, segmenter.crop_size,
+                                            preview_scale, preview_fps)
+    samples = _track_pupil(stabilized, segmenter, out, preview, frame_step, first_index=start)
+    
+    source.release()
+    if out is not None:
+        with timer.stage("encode"):
+            out.release()
+    return samples, timer.seconds, _peak_memory_bytes()
+
+def _concatenate_videos(paths, output_path):
+    """Join videos with the same size and frame rate into one (re-encoded with the same codec)."""
+    if len(paths) == 1:
+        os.replace(paths[0], output_path)
+        return
+    out = None
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if out is None:
+            fourcc = cv2.VideoWriter_fourcc(*'avc1')  # H.264 codec
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(output_path, fourcc, cap.get(cv2.CAP_PROP_FPS), size, isColor=True)
+        for frame in _read_frames(cap):
+            out.write(frame)
+        cap.release()
+    if out is not None:
+        out.release()
+
+def _stabilize_and_detect_in_segments(input_path, output_path, bounds, fps, total_frames, executor=None,
+                                      zoom_factor=1.2, roi_width=900, roi_height=300, movement_threshold=30,
+                                      cooldown=0.3, vertical_offset=0.08, strict_threshold=50,
+                                      smoothing_window=30, progress=None, render="full", preview_scale=0.5,
+                                      preview_fps=10, timer=None, trajectory_path=None):
+    """
+    The 'segments' > 1 case of stabilize_and_detect_movements: stabilize and track the (start, stop) frame
+    ranges in 'bounds' in parallel, then run movement detection once over the joined trajectory.
+    
+    Because detection runs on the joined trajectory, 'previous_centroid' and the cooldown carry across
+    segment boundaries exactly as in a single pass. Segment videos are written next to 'output_path' and
+    joined into it at the end. Stage times recorded in 'timer' are summed over the segments, so they
+    add up to more than the elapsed time.
+    """
+    if timer is None:
+        timer = StageTimer()
+    segmenter_params = {
+        "zoom_factor": zoom_factor,
+        "roi_width": roi_width,
+        "roi_height": roi_height,
+        "vertical_offset": vertical_offset,
+        "strict_threshold": strict_threshold
+    }
+    
+    segment_paths = [None] * len(bounds)
+    if render != "none":
+        base_name, extension = os.path.splitext(output_path)
+        segment_paths = [f"{base_name}_{uuid.uuid4().hex}_segment{k}{extension}" for k in range(len(bounds))]
+    
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=len(bounds))
+    try:
+        futures = {}
+        for k, (start, stop) in enumerate(bounds):
+            # The container's frame count can be off by a few frames; the last segment reads to the end.
+            stop = None if k == len(bounds) - 1 else stop
+            future = executor.submit(_track_segment, input_path, segment_paths[k], start, stop, fps,
+                                     smoothing_window=smoothing_window, render=render,
+                                     preview_scale=preview_scale, preview_fps=preview_fps, **segmenter_params)
+            futures[future] = k
+        
+        results = [None] * len(bounds)
+        frames_processed = 0
+        try:
+            for future in as_completed(futures):
+                samples, seconds, peak_memory_bytes = future.result()
+                results[futures[future]] = samples
+                timer.merge(seconds, peak_memory_bytes)
+                frames_processed += len(samples)
+                if progress is not None:
+                    progress(frames_processed, max(total_frames, frames_processed))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        
+        if render != "none":
+            with timer.stage("concatenate"):
+                _concatenate_videos(segment_paths, output_path)
+    finally:
+        if own_executor:
+            executor.shutdown()
+        for path in segment_paths:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+    
+    samples = [sample for segment_samples in results for sample in segment_samples]
+    timer.frames += len(samples)
+    return _finish_trajectory(samples, fps, movement_threshold, cooldown, trajectory_path)
+
+def warm_up(width=320, height=240, smoothing_window=30):
+    """
+    Run a short synthetic clip through stabilization and detection in this process.
+    
+    The first frames a process handles pay for OpenCV's and VidStab's one-time setup (loading and
+    dispatching optimized kernels, creating thread pools, allocating buffers); this moves that cost to
+    server start.
+    """
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (height + 8, width + 8, 3), dtype=np.uint8)
+    frames = (background[k % 8:k % 8 + height, :width] for k in range(smoothing_window + 2))
+    segmenter = PupilSegmenter(width, height, roi_width=width // 2, roi_height=height // 3)
+    for frame in _stabilized_frames(frames, smoothing_window=smoothing_window):
+        contour = segmenter.segment(frame)
+        if contour is not None:
+            segmenter.render(contour)
+
+def _init_job_worker():
+    """
+    Initializer of the job worker pool's processes: restore the default signal handlers, then warm up.
+    
+    Job workers are forked from a server process and would otherwise keep its signal handlers. Under
+    gunicorn those only tell the web worker to exit, so SIGTERM or Ctrl+C would leave the job workers running.
+    """
+    for name in ("SIGTERM", "SIGINT", "SIGQUIT", "SIGHUP", "SIGUSR1", "SIGUSR2", "SIGWINCH", "SIGABRT", "SIGTTIN",
+                 "SIGTTOU"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), signal.SIG_DFL)
+    # The handlers also wrote to a pipe of the server process on every signal.
+    if hasattr(signal, "set_wakeup_fd"):
+        signal.set_wakeup_fd(-1)
+    warm_up()
+
+def _job_path(job_id):
+    return os.path.join(jobs_folder, f"{job_id}.json")
+
+def _read_job(job_id):
+    """Load a job record, or return None if the ID is malformed or unknown."""
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_json_atomic(path, data, attempts=20, retry_delay=0.05):
+    # Write to a temporary file and rename it so readers never see a half-written record.
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    # On Windows the rename fails while another process (e.g. a /jobs status request) has the
+    # target open; readers only hold it briefly, so try again.
+    for attempt in range(attempts):
+        try:
+            os.replace(temp_path, path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                os.remove(temp_path)
+                raise
+            time.sleep(retry_delay)
+
+def _write_job(job):
+    _write_json_atomic(_job_path(job["job_id"]), job)
+
+def _update_job(job_id, **fields):
+    job = _read_job(job_id)
+    job.update(fields)
+    _write_job(job)
+    return job
+
+def _upload_marker_path(job_id):
+    # Written once the last chunk of a chunked upload has arrived. A separate file rather than a field in
+    # the job record, so it cannot be lost to a worker rewriting the record with a progress update.
+    return os.path.join(jobs_folder, f"{job_id}.uploaded")
+
+def _upload_lock_path(job_id):
+    return os.path.join(jobs_folder, f"{job_id}.lock")
+
+def _job_started_path(job_id):
+    # Written when a job is handed to the worker pool. A chunked upload's job is claimed with it just before,
+    # so only one server process hands it over.
+    return os.path.join(jobs_folder, f"{job_id}.started")
+
+@contextmanager
+def _locked(thread_lock, lock_path):
+    """Hold 'thread_lock' and an exclusive file lock on 'lock_path', which other processes respect."""
+    # Append mode, so opening the file never truncates a range another process has locked on Windows.
+    with thread_lock, open(lock_path, "a") as f:
+        if fcntl is not None:
+            # Released when the file is closed.
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+            return
+        # msvcrt locks a byte range and LK_LOCK gives up after about 10 seconds, so keep trying.
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                pass
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _upload_locked(job_id):
+    """
+    Lock a chunked upload for checking and appending a chunk. With several server processes (see wsgi.py)
+    the chunks of one upload can reach different processes, so this also takes a file lock.
+    """
+    return _locked(_upload_lock, _upload_lock_path(job_id))
+
+def _job_files(job):
+    """Paths of the files a job produced or consumed."""
+    paths = [os.path.join(saved_folder, job["results_file"])]
+    if job.get("processed_file"):
+        paths.append(os.path.join(app.config['PROCESSED_FOLDER'], job["processed_file"]))
+    if job.get("upload_file"):
+        paths.append(os.path.join(app.config['UPLOAD_FOLDER'], job["upload_file"]))
+    if job.get("trajectory_file"):
+        paths.append(os.path.join(saved_folder, job["trajectory_file"]))
+    return paths
+
+def _save_upload(file, path, chunk_size=1024 * 1024):
+    """Save an uploaded file and return the SHA-256 of its contents, computed while writing."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def _cache_key(content_hash, params):
+    # Any parameter that changes the output must be part of the key.
+    key_source = json.dumps({"content": content_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(cache_folder, f"{key}.json")
+
+def _lookup_cache(key):
+    """
+    Return the job that already handles this upload and these parameters, or None.
+    
+    Jobs that are still queued or running count as hits too, so a retried upload attaches to the
+    job started by the first attempt instead of processing the same video twice. A queued job that
+    was never handed to the worker pool will never run, so it does not count.
+    """
+    try:
+        with open(_cache_path(key)) as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    job = _read_job(entry["job_id"])
+    if job is None or job["status"] == "failed":
+        return None
+    if job["status"] == "queued" and not os.path.exists(_job_started_path(job["job_id"])):
+        return None
+    entry["last_used"] = time.time()
+    _write_json_atomic(_cache_path(key), entry)
+    return job
+
+def _store_cache(key, job_id):
+    """
+    Cache 'job_id' under 'key'.
+    
+    A different job already cached under the key (one that failed, or the first of two uploads of the same
+    video) is not forgotten: its entry moves to a key derived from its ID, like a chunked upload's placeholder,
+    which nothing looks up but which lets eviction still clean up its files.
+    """
+    try:
+        with open(_cache_path(key)) as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        entry = None
+    if entry is not None and entry["job_id"] != job_id:
+        displaced_job = _read_job(entry["job_id"])
+        if displaced_job is not None:
+            _write_json_atomic(_cache_path(_cache_key(displaced_job["job_id"], displaced_job["params"])), entry)
+    
+    now = time.time()
+    _write_json_atomic(_cache_path(key), {"job_id": job_id, "created_at": now, "last_used": now})
+
+def _fail_abandoned_upload(job):
+    """
+    Fail a chunked upload whose job has not started and that has not received a chunk for
+    UPLOAD_IDLE_TIMEOUT seconds, and return the job record as it is now.
+    """
+    job_id = job["job_id"]
+    if not job.get("chunked") or os.path.exists(_job_started_path(job_id)):
+        return job
+    upload_path = os.path.join(app.config['UPLOAD_FOLDER'], job["upload_file"])
+    timeout = app.config['UPLOAD_IDLE_TIMEOUT']
+    with _upload_locked(job_id):
+        try:
+            idle = time.time() - os.path.getmtime(upload_path)
+        except FileNotFoundError:
+            idle = timeout
+        if os.path.exists(_job_started_path(job_id)) or idle < timeout:
+            return job
+        # Claim the job so a late chunk cannot start it any more.
+        open(_job_started_path(job_id), "w").close()
+        return _update_job(job_id, status="failed", error=f"No upload data received for {timeout} seconds.",
+                           finished_at=time.time())
+
+def _evict_cache():
+    """
+    Delete cached jobs older than CACHE_MAX_AGE, then the least recently used ones until the rest
+    fit in CACHE_MAX_BYTES. Jobs that are still queued or running are never evicted, except chunked
+    uploads that stopped receiving chunks before their job started, which are failed first.
+    """
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_folder):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(cache_folder, name)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Removed by another process, or still being written.
+            continue
+        job = _read_job(entry["job_id"])
+        if job is not None and job["status"] in ("queued", "running"):
+            job = _fail_abandoned_upload(job)
+            if job["status"] != "failed":
+                continue
+        paths = _job_files(job) if job is not None else []
+        size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        entries.append((entry["last_used"], entry["created_at"], size, name, job, paths))
+
+    entries.sort()
+    total_size = sum(entry[2] for entry in entries)
+    for last_used, created_at, size, name, job, paths in entries:
+        expired = now - created_at > app.config['CACHE_MAX_AGE']
+        if not expired and job is not None and total_size <= app.config['CACHE_MAX_BYTES']:
+            continue
+        stale_paths = paths + [os.path.join(cache_folder, name)]
+        if job is not None:
+            stale_paths += [_job_path(job["job_id"]), _upload_marker_path(job["job_id"]),
+                            _upload_lock_path(job["job_id"]), _job_started_path(job["job_id"])]
+        for path in stale_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total_size -= size
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config['JOB_WORKERS'], initializer=_init_job_worker)
+        return _executor
+
+def _discard_executor(executor):
+    """
+    Forget a worker pool that a dead worker (e.g. one killed for memory) has broken, so that
+    _get_executor starts a new one; a broken pool rejects every task submitted to it.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+def start_job_workers(web_workers=1):
+    """
+    Start the job worker pool now instead of on the first upload, so its processes are warmed up by then.
+    
+    For servers that run 'web_workers' processes of this app, each gets an equal share of JOB_WORKERS.
+    The pools are separate, so a process with several jobs cannot use the share of an idle one, and a
+    single job never gets more than its own process's share (see gunicorn.conf.py).
+    """
+    app.config['JOB_WORKERS'] = max(1, app.config['JOB_WORKERS'] // web_workers)
+    # A task makes the pool launch its processes, each of which runs _init_job_worker first.
+    _get_executor().submit(int).result()
+
+def _get_coordinator_executor():
+    global _coordinator_executor
+    with _executor_lock:
+        if _coordinator_executor is None:
+            _coordinator_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'])
+        return _coordinator_executor
+
+def _timings_block(timer, seconds):
+    """The 'timings' block of a results file: stage times, and throughput over 'seconds' of processing."""
+    return {
+        "stages": dict(sorted(timer.seconds.items())),
+        "frames": timer.frames,
+        "seconds": seconds,
+        "fps": timer.frames / seconds if seconds > 0 else None,
+        "peak_memory_bytes": timer.peak_memory_bytes
+    }
+
+def _metrics_path():
+    return os.path.join(metrics_folder, "metrics.json")
+
+def _read_metrics():
+    try:
+        with open(_metrics_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"jobs": {}, "frames": 0, "job_seconds": 0.0, "stage_seconds": {}, "peak_memory_bytes": 0}
+
+def _record_job_metrics(status, timer, seconds):
+    """
+    Add a finished job to the counters in metrics/metrics.json, which /metrics reports.
+    
+    All worker and server processes add to the same file, under a lock, so the totals survive
+    processes exiting without a file being left behind for each of them.
+    """
+    with _locked(_metrics_lock, os.path.join(metrics_folder, "metrics.lock")):
+        metrics = _read_metrics()
+        metrics["jobs"][status] = metrics["jobs"].get(status, 0) + 1
+        for name, value in timer.seconds.items():
+            metrics["stage_seconds"][name] = metrics["stage_seconds"].get(name, 0.0) + value
+        if status == "done":
+            metrics["frames"] += timer.frames
+            metrics["job_seconds"] += seconds
+            metrics["peak_memory_bytes"] = max(metrics["peak_memory_bytes"], timer.peak_memory_bytes or 0)
+            metrics["last_job"] = {
+                "finished_at": time.time(),
+                "fps": timer.frames / seconds if seconds > 0 else 0.0,
+                "peak_memory_bytes": timer.peak_memory_bytes or 0
+            }
+        _write_json_atomic(_metrics_path(), metrics)
+
+def _run_job(job_id, input_path, processed_path, json_path, video_url, params, chunked=False, executor=None,
+             upload_seconds=None, trajectory_path=None, trajectory_url=None):
+    """
+    Process one uploaded video in a pool worker.
+    
+    Progress and the final status are written to the job record, which is how the web process
+    (or any other server process) learns about them. With 'chunked' set the upload is still arriving:
+    the web process only starts such a job once the chunks so far show that it can be decoded as the
+    rest comes in (see _upload_layout), and frames are then decoded alongside the upload.
+    
+    A job split into segments instead runs on a thread in the web process, handing the segments to
+    'executor' (the worker pool); a pool worker waiting on the pool could deadlock it.
+    
+    Stage timings go to /metrics and, if params["timings"] is set, into the results file. The per-frame
+    trajectory is saved to 'trajectory_path' for /reanalyze and linked from the results as 'trajectory_url'.
+    """
+    _update_job(job_id, status="running", started_at=time.time())
+    params = dict(params)
+    include_timings = params.pop("timings", False)
+    timer = StageTimer()
+    if upload_seconds is not None:
+        timer.add("upload_save", upload_seconds)
+    if executor is None:
+        _reset_peak_memory()
+    start = time.perf_counter()
+    
+    def report_progress(frames_processed, frames_total):
+        # Progress is informational; a failed update must not fail the job.
+        try:
+            _update_job(job_id, frames_processed=frames_processed, frames_total=frames_total)
+        except OSError as e:
+            print(f"Could not update progress of job {job_id}: {e}")
+    
+    upload_options = {}
+    if chunked:
+        marker_path = _upload_marker_path(job_id)
+        upload_options = {
+            "upload_complete": lambda: os.path.exists(marker_path),
+            "upload_timeout": app.config['UPLOAD_IDLE_TIMEOUT']
+        }
+    
+    try:
+        movement_timestamps = stabilize_and_detect_movements(input_path, processed_path, progress=report_progress,
+                                                             executor=executor, timer=timer,
+                                                             trajectory_path=trajectory_path,
+                                                             **upload_options, **params)
+        if processed_path is not None:
+            print(f"Stabilized video saved to: {processed_path}")
+        # Segment workers measure their own memory.
+        if executor is None:
+            timer.peak_memory_bytes = _peak_memory_bytes()
+        
+        results = {
+            "video_url": video_url,
+            "sudden_movements": movement_timestamps
+        }
+        if trajectory_path is not None:
+            results["trajectory_url"] = trajectory_url
+        if include_timings:
+            # Writing the file cannot be timed in the file itself; json_write is only in /metrics.
+            results["timings"] = _timings_block(timer, time.perf_counter() - start)
+        with timer.stage("json_write"):
+            with open(json_path, "w") as f:
+                json.dump(results, f)
+        print(f"Results JSON saved to: {json_path}")
+    except Exception as e:
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+        _record_job_metrics("failed", timer, time.perf_counter() - start)
+        raise
+    
+    seconds = time.perf_counter() - start
+    _update_job(job_id, status="done", finished_at=time.time())
+    _record_job_metrics("done", timer, seconds)
+    print(f"Processed {timer.frames} frames in {seconds:.1f} s ({timer.frames / seconds:.1f} frames/s): "
+          + ", ".join(f"{name} {value:.2f} s" for name, value in sorted(timer.seconds.items())))
+    _evict_cache()
+
+def _on_job_finished(job_id, future, executor):
+    # A worker that dies outright (e.g. killed for memory) never gets to record the failure itself,
+    # and takes the whole pool down with it.
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _discard_executor(executor)
+    if error is not None:
+        job = _read_job(job_id)
+        if job is not None and job["status"] not in ("done", "failed"):
+            _update_job(job_id, status="failed", error=str(error), finished_at=time.time())
+
+def _job_status(job):
+    status = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "frames_processed": job["frames_processed"],
+        "frames_total": job["frames_total"],
+        "status_url": url_for('job_status', job_id=job["job_id"], _external=True),
+        "result_url": url_for('job_result', job_id=job["job_id"], _external=True)
+    }
+    if job.get("error"):
+        status["error"] = job["error"]
+    return status
+
+def _detection_params(form):
+    """
+    Build the parameters for stabilize_and_detect_movements from the request form.
+    
+    'render' picks the output video (see RENDER_MODES). 'segments' asks for a long video to be processed
+    in that many parallel segments, up to the number of CPUs; segments beyond this process's JOB_WORKERS
+    wait for a free job worker. 'timings' (1/true) adds a timings block to the results. Raises ValueError
+    for invalid values.
+    """
+    render = form.get('render', 'full')
+    if render not in RENDER_MODES:
+        raise ValueError(f"render must be one of {', '.join(RENDER_MODES)}")
+    # Convert the raw value here: with type=int a value that does not parse would silently become 1.
+    try:
+        segments = int(form.get('segments', 1))
+    except ValueError:
+        raise ValueError("segments must be a positive integer") from None
+    if segments < 1:
+        raise ValueError("segments must be a positive integer")
+
+    return {
+        "zoom_factor": 1.2,
+        "roi_width": 900,
+        "roi_height": 300,
+        "movement_threshold": 30,
+        "cooldown": 0.3,
+        "vertical_offset": 0.08,
+        "strict_threshold": 50,
+        "smoothing_window": 30,
+        "render": render,
+        "segments": min(segments, os.cpu_count() or 1),
+        "timings": form.get('timings', '').lower() in ("1", "true", "yes")
+    }
+
+def _upload_filename(job_id, filename):
+    return f"{job_id}_{filename}"
+
+def _submit_job(job_id, filename, params, cache_key, chunked=False, upload_seconds=None):
+    """
+    Record a queued job for an upload in UPLOAD_FOLDER and hand it to the worker pool.
+    
+    A chunked upload ('chunked') is only recorded; upload_chunk or complete_upload start its job once
+    there is something to decode (see _claim_upload_job). 'upload_seconds' is the time it took to save
+    the upload, for the job's timings.
+    """
+    base_name, _ = os.path.splitext(filename)
+    processed_filename = None if params["render"] == "none" else f"{base_name}_{job_id}_processed.mp4"
+    job = {
+        "job_id": job_id,
+        "status": "queued",
+        "created_at": time.time(),
+        "frames_processed": 0,
+        "frames_total": 0,
+        "upload_file": _upload_filename(job_id, filename),
+        "processed_file": processed_filename,
+        "results_file": f"{base_name}_{job_id}_results.json",
+        "trajectory_file": f"{base_name}_{job_id}_trajectory.npz",
+        "params": params,
+        "chunked": chunked
+    }
+    _write_job(job)
+    # Only a job that is on its way can be reused. One that could not start is still cached, under a key
+    # derived from its ID like a chunked upload's placeholder, so that eviction removes its files.
+    if not chunked and not _start_job(job, upload_seconds=upload_seconds):
+        job = _read_job(job_id)
+        cache_key = _cache_key(job_id, params)
+    _store_cache(cache_key, job_id)
+    return job
+
+def _start_job(job, chunked=False, upload_seconds=None):
+    """
+    Hand a recorded job to the worker pool. 'chunked' is for a chunked upload started before its last
+    chunk, which the job then decodes as it arrives.
+    
+    Returns True once the job is queued. If that fails, the job is marked as failed and False is returned.
+    """
+    job_id = job["job_id"]
+    params = job["params"]
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], job["upload_file"])
+    if job["processed_file"] is None:
+        processed_path = video_url = None
+    else:
+        processed_path = os.path.join(app.config['PROCESSED_FOLDER'], job["processed_file"])
+        video_url = url_for('processed_file', filename=job["processed_file"], _external=True)
+    json_path = os.path.join(saved_folder, job["results_file"])
+    trajectory_path = os.path.join(saved_folder, job["trajectory_file"])
+    trajectory_url = url_for('saved_file', filename=job["trajectory_file"], _external=True)
+
+    job_args = (job_id, input_path, processed_path, json_path, video_url, params)
+    job_options = {
+        "chunked": chunked,
+        "upload_seconds": upload_seconds,
+        "trajectory_path": trajectory_path,
+        "trajectory_url": trajectory_url
+    }
+    # A pool broken by a worker that died since the last job is replaced once.
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            if params["segments"] > 1:
+                future = _get_coordinator_executor().submit(_run_job, *job_args, executor=executor, **job_options)
+            else:
+                future = executor.submit(_run_job, *job_args, **job_options)
+            break
+        except BrokenProcessPool as e:
+            _discard_executor(executor)
+            error = e
+    else:
+        print(f"Could not start job {job_id}: {error}")
+        _update_job(job_id, status="failed", error=f"Could not start the job: {error}", finished_at=time.time())
+        return False
+    open(_job_started_path(job_id), "w").close()
+    future.add_done_callback(lambda f: _on_job_finished(job_id, f, executor))
+    return True
+
+def _claim_upload_job(job, upload_path, complete):
+    """
+    Decide whether the job of a chunked upload starts now, and if so claim it so no other request starts it.
+    
+    Before the upload is 'complete' the job only starts if what has arrived shows that it can be decoded as
+    the rest comes in, so pool workers never sit waiting for a slow upload to finish. Call with the upload
+    locked, and start the job after releasing the lock: pool workers forked while it is held would keep it.
+    
+    Returns None if the job does not start (yet), otherwise whether it starts before the upload is complete.
+    """
+    started_path = _job_started_path(job["job_id"])
+    if os.path.exists(started_path):
+        return None
+    streaming = not complete and job["params"]["segments"] == 1 and _upload_layout(upload_path) is True
+    if not (complete or streaming):
+        return None
+    open(started_path, "w").close()
+    return streaming
+
+def _cached_response(cached_job):
+    print(f"Upload matches job {cached_job['job_id']}; reusing its result")
+    return jsonify(_job_status(cached_job)), 200 if cached_job["status"] == "done" else 202
+
 @app.route('/stabilize', methods=['POST'])
 def stabilize_video():
     if 'file' not in request.files:
@@ -158,42 +1414,265 @@ def stabilize_video():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    try:
+        params = _detection_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job_id = uuid.uuid4().hex
     filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], _upload_filename(job_id, filename))
+    upload_start = time.perf_counter()
+    content_hash = _save_upload(file, input_path)
+    upload_seconds = time.perf_counter() - upload_start
     print(f"Uploaded video saved to: {input_path}")
 
-    timestamp = int(time.time())
-    base_name, _ = os.path.splitext(filename)
-    processed_filename = f"{base_name}_{timestamp}_processed.mp4"
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-
-    movement_timestamps = stabilize_and_detect_movements(
-        input_path,
-        processed_path,
-        zoom_factor=1.2,
-        roi_width=900,
-        roi_height=300,
-        movement_threshold=30,
-        cooldown=0.3,
-        vertical_offset=0.08
-    )
-
-    print(f"Stabilized video saved to: {processed_path}")
-
-    results = {
-        "video_url": f"http://localhost:5000/{app.config['PROCESSED_FOLDER']}/{processed_filename}",
-        "sudden_movements": movement_timestamps
+    # The same bytes with the same parameters give the same result; reuse it.
+    cache_key = _cache_key(content_hash, params)
+    cached_job = _lookup_cache(cache_key)
+    if cached_job is not None:
+        os.remove(input_path)
+        return _cached_response(cached_job)
+
+    job = _submit_job(job_id, filename, params, cache_key, upload_seconds=upload_seconds)
+    return jsonify(_job_status(job)), 500 if job["status"] == "failed" else 202
+
+def _read_chunked_upload(job_id):
+    """Return (job, upload path) for a chunked upload, or (None, None) if there is no such upload."""
+    job = _read_job(job_id)
+    if job is None or not job.get("chunked"):
+        return None, None
+    return job, os.path.join(app.config['UPLOAD_FOLDER'], job["upload_file"])
+
+def _upload_state(job_id, upload_path):
+    return {
+        "offset": os.path.getsize(upload_path) if os.path.exists(upload_path) else 0,
+        "upload_complete": os.path.exists(_upload_marker_path(job_id))
     }
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload.
     
-    json_filename = f"{base_name}_{timestamp}_results.json"
-    json_path = os.path.join(saved_folder, json_filename)
-    with open(json_path, "w") as f:
-        json.dump(results, f)
+    The video is sent in chunks with PUT /uploads/<job_id>?offset=N and finished with
+    POST /uploads/<job_id>/complete. For streamable containers (fast-start or fragmented MP4, WebM,
+    MPEG-TS) processing starts as soon as the chunks so far show it, and frames are decoded as the rest
+    arrives; otherwise it starts once the upload is complete. Form fields: 'filename', 'render',
+    'segments' and optionally 'sha256', the hex digest of the whole file, which lets a previously
+    processed video skip the upload entirely.
+    """
+    filename = secure_filename(request.form.get('filename', ''))
+    if filename == '':
+        return jsonify({'error': 'No filename provided'}), 400
+
+    try:
+        params = _detection_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    content_hash = request.form.get('sha256', '').lower()
+    if content_hash:
+        cached_job = _lookup_cache(_cache_key(content_hash, params))
+        if cached_job is not None:
+            return _cached_response(cached_job)
+
+    job_id = uuid.uuid4().hex
+    open(os.path.join(app.config['UPLOAD_FOLDER'], _upload_filename(job_id, filename)), "wb").close()
+    # The content hash is only known once the upload is complete. Until then the job is cached under a key
+    # derived from its ID, which nothing looks up but which lets eviction clean up abandoned uploads.
+    job = _submit_job(job_id, filename, params, _cache_key(job_id, params), chunked=True)
+
+    status = _job_status(job)
+    status["upload_url"] = url_for('upload_chunk', job_id=job_id, _external=True)
+    status["offset"] = 0
+    return jsonify(status), 202
+@app.route('/uploads/<job_id>', methods=['PUT'])
+def upload_chunk(job_id):
+    """
+    Append the request body to a chunked upload.
+    
+    'offset' must equal the number of bytes received so far; otherwise nothing is written and the
+    current offset is returned with 409 so the client can resume from there.
+    """
+    job, upload_path = _read_chunked_upload(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'offset is required'}), 400
+
+    # Receive the chunk before taking the lock, so a slow client does not hold up other uploads.
+    chunk_path = f"{upload_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(chunk_path, "wb") as f:
+            shutil.copyfileobj(request.stream, f, 1024 * 1024)
+        with _upload_locked(job_id):
+            state = _upload_state(job_id, upload_path)
+            if state["upload_complete"]:
+                return jsonify({'error': 'Upload is already complete', **state}), 409
+            if offset != state["offset"]:
+                return jsonify({'error': 'offset does not match the data received', **state}), 409
+            with open(chunk_path, "rb") as src, open(upload_path, "ab") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            streaming = _claim_upload_job(job, upload_path, complete=False)
+            state = _upload_state(job_id, upload_path)
+    finally:
+        os.remove(chunk_path)
+    if streaming is not None:
+        _start_job(job, chunked=streaming)
+    return jsonify(state)
+
+@app.route('/uploads/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    job, upload_path = _read_chunked_upload(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(_upload_state(job_id, upload_path))
+
+@app.route('/uploads/<job_id>/complete', methods=['POST'])
+def complete_upload(job_id):
+    """
+    Mark a chunked upload as complete. If 'total_size' is given it must match the bytes received.
+    """
+    job, upload_path = _read_chunked_upload(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+    total_size = request.form.get('total_size', type=int)
+    with _upload_locked(job_id):
+        state = _upload_state(job_id, upload_path)
+        if total_size is not None and total_size != state["offset"]:
+            return jsonify({'error': 'total_size does not match the data received', **state}), 409
+        open(_upload_marker_path(job_id), "w").close()
+        streaming = _claim_upload_job(job, upload_path, complete=True)
+    if streaming is not None and not _start_job(job, chunked=streaming):
+        # It stays cached under its placeholder key, for eviction.
+        return jsonify(_job_status(_read_job(job_id))), 500
+    print(f"Uploaded video saved to: {upload_path}")
+
+    # Now that the content is known, let later uploads of the same video reuse this job.
+    sha256 = hashlib.sha256()
+    with open(upload_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    placeholder_path = _cache_path(_cache_key(job_id, job["params"]))
+    _store_cache(_cache_key(sha256.hexdigest(), job["params"]), job_id)
+    try:
+        os.remove(placeholder_path)
+    except FileNotFoundError:
+        pass
+
+    return jsonify(_job_status(_read_job(job_id)))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = _read_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(_job_status(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = _read_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job["status"] == "failed":
+        return jsonify(_job_status(job)), 500
+    if job["status"] != "done":
+        # Not finished yet; report the current status instead.
+        return jsonify(_job_status(job)), 202
+    return send_from_directory(saved_folder, job["results_file"], mimetype="application/json")
+
+@app.route('/reanalyze', methods=['POST'])
+def reanalyze():
+    """
+    Detect sudden movements again for a finished job with other thresholds, from its stored trajectory.
     
-    json_file_url = f"http://localhost:5000/saved/{json_filename}"
-    print(f"Results JSON saved to: {json_path}")
-    return jsonify({"results_url": json_file_url})
+    Form fields: 'job_id', and 'movement_threshold' (pixels) and/or 'cooldown' (seconds); whichever is
+    left out keeps the job's original value. No video is decoded, so this takes milliseconds.
+    """
+    job = _read_job(request.form.get('job_id', ''))
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job["status"] == "failed":
+        return jsonify(_job_status(job)), 500
+    if job["status"] != "done":
+        return jsonify(_job_status(job)), 202
+    if not job.get("trajectory_file"):
+        return jsonify({'error': 'No trajectory stored for this job'}), 404
+
+    # Convert the raw values here: with type=float a value that does not parse would silently become the default.
+    invalid = jsonify({'error': 'movement_threshold and cooldown must be non-negative numbers'}), 400
+    try:
+        movement_threshold = float(request.form.get('movement_threshold', job["params"]["movement_threshold"]))
+        cooldown = float(request.form.get('cooldown', job["params"]["cooldown"]))
+    except ValueError:
+        return invalid
+    if not (math.isfinite(movement_threshold) and math.isfinite(cooldown)) or movement_threshold < 0 or cooldown < 0:
+        return invalid
+
+    trajectory = load_trajectory(os.path.join(saved_folder, job["trajectory_file"]))
+    return jsonify({
+        "job_id": job["job_id"],
+        "movement_threshold": movement_threshold,
+        "cooldown": cooldown,
+        "sudden_movements": detect_sudden_movements(trajectory, movement_threshold, cooldown)
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Processing metrics of all server processes, in the Prometheus text format."""
+    # The file is replaced atomically, so it can be read without the lock.
+    totals = _read_metrics()
+    jobs = totals["jobs"]
+    stage_seconds = totals["stage_seconds"]
+    frames = totals["frames"]
+    job_seconds = totals["job_seconds"]
+    peak_memory_bytes = totals["peak_memory_bytes"]
+    last_job = totals.get("last_job")
+
+    lines = [
+        "# HELP pupiltrack_jobs_total Processing jobs finished, by outcome.",
+        "# TYPE pupiltrack_jobs_total counter"
+    ]
+    lines += [f'pupiltrack_jobs_total{{status="{status}"}} {count}' for status, count in sorted(jobs.items())]
+    lines += [
+        "# HELP pupiltrack_stage_seconds_total Time spent in each processing stage.",
+        "# TYPE pupiltrack_stage_seconds_total counter"
+    ]
+    lines += [f'pupiltrack_stage_seconds_total{{stage="{stage}"}} {seconds}'
+              for stage, seconds in sorted(stage_seconds.items())]
+    lines += [
+        "# HELP pupiltrack_frames_total Frames processed by successful jobs.",
+        "# TYPE pupiltrack_frames_total counter",
+        f"pupiltrack_frames_total {frames}",
+        "# HELP pupiltrack_job_seconds_total Processing time of successful jobs.",
+        "# TYPE pupiltrack_job_seconds_total counter",
+        f"pupiltrack_job_seconds_total {job_seconds}",
+        "# HELP pupiltrack_job_peak_memory_bytes Highest peak resident memory of any job.",
+        "# TYPE pupiltrack_job_peak_memory_bytes gauge",
+        f"pupiltrack_job_peak_memory_bytes {peak_memory_bytes}"
+    ]
+    if last_job is not None:
+        lines += [
+            "# HELP pupiltrack_last_job_frames_per_second Throughput of the most recent successful job.",
+            "# TYPE pupiltrack_last_job_frames_per_second gauge",
+            f"pupiltrack_last_job_frames_per_second {last_job['fps']}",
+            "# HELP pupiltrack_last_job_peak_memory_bytes Peak resident memory of the most recent successful job.",
+            "# TYPE pupiltrack_last_job_peak_memory_bytes gauge",
+            f"pupiltrack_last_job_peak_memory_bytes {last_job['peak_memory_bytes']}"
+        ]
+    return Response("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/processed/<path:filename>', methods=['GET'])
+def processed_file(filename):
+    return send_from_directory(app.config['PROCESSED_FOLDER'], filename)
+
+@app.route('/saved/<path:filename>', methods=['GET'])
+def saved_file(filename):
+    return send_from_directory(saved_folder, filename)
 
 if __name__ == '__main__':
+    # Development server; see wsgi.py for running in production.
     app.run(debug=True, host='0.0.0.0', port=5000)
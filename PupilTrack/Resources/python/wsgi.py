@@ -0,0 +1,22 @@
+"""
+WSGI entry point for running the server in production instead of the Flask development server.
+
+On Linux/macOS, with pre-forked gunicorn workers (settings in gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+On Windows, where gunicorn does not run, with waitress (one process, many threads):
+
+    waitress-serve --host=0.0.0.0 --port=5000 --threads=8 --call wsgi:create_app
+
+Importing this module imports OpenCV, VidStab and NumPy once. gunicorn does that in its master process
+and forks the web workers from it; each worker then starts and warms up its share of the job workers.
+Finished videos in processed/ and results in saved/ are sent with Range support (HTTP 206), and gunicorn
+sends whole files with sendfile(2) without copying them through Python.
+"""
+from video_stabilizer import app, start_job_workers
+
+def create_app():
+    """Start the job workers and return the app, for servers without a post-fork hook (waitress)."""
+    start_job_workers()
+    return app